@@ -7,12 +7,20 @@ and stores results in Vercel Blob Storage
 
 import os
 import secrets
+import shutil
 import tempfile
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 import hashlib
+import logging
+import logging.handlers
+import queue
+import sqlite3
+import time
 from urllib.parse import urlparse
 
 from fastapi import FastAPI, HTTPException, Security, Depends
@@ -20,25 +28,75 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, HttpUrl
 import uvicorn
 import httpx
+import numpy as np
 import torch
 from demucs.pretrained import get_model
 from demucs.apply import apply_model
-import librosa
 import soundfile as sf
-from pydub import AudioSegment
+import av
+import lameenc
 import aiofiles
 
+try:
+    import numba
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+from quantize_model import apply_precision, load_fp16_model, load_quantized_weights
+from vocal_batcher import VocalBatcher
+
+# Logging
+# Records are queued by the calling thread and written to stderr by a listener thread,
+# so request handlers never block on the write
+LOG_QUEUE = queue.SimpleQueue()
+LOG_LISTENER = logging.handlers.QueueListener(LOG_QUEUE, logging.StreamHandler())
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    handlers=[logging.handlers.QueueHandler(LOG_QUEUE)]
+)
+LOG_LISTENER.start()
+logger = logging.getLogger("vocal_api")
+
 # Configuration
 API_TOKEN = os.getenv("API_TOKEN", None)
 VERCEL_BLOB_READ_WRITE_TOKEN = os.getenv("VERCEL_BLOB_READ_WRITE_TOKEN")
 VERCEL_BLOB_STORE_ID = os.getenv("VERCEL_BLOB_STORE_ID", "")
+MODEL_PRECISION = os.getenv("MODEL_PRECISION", "fp32").lower()
+# Optional weights from quantize_model.py: an INT8 checkpoint or FP16 .safetensors
+MODEL_WEIGHTS = os.getenv("MODEL_WEIGHTS", "")
+# torch.compile defaults to on for CUDA, where fused kernels pay for the compile time
+TORCH_COMPILE = os.getenv("TORCH_COMPILE", "1" if torch.cuda.is_available() else "0") == "1"
+TORCH_COMPILE_MODE = os.getenv("TORCH_COMPILE_MODE", "max-autotune")
+# "inductor", or "tensorrt" to hand the supported subgraphs to TensorRT (needs torch-tensorrt)
+TORCH_COMPILE_BACKEND = os.getenv("TORCH_COMPILE_BACKEND", "inductor").lower()
+# Concurrent requests arriving within BATCH_WINDOW_MS share one model call of up to MAX_BATCH tracks
+MAX_BATCH = int(os.getenv("MAX_BATCH", "4" if torch.cuda.is_available() else "1"))
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "50"))
+# Separation window length (seconds, htdemucs supports up to 7.8) and the fraction of each
+# window overlapping the next one; lower overlap is faster with slightly more audible seams
+DEMUCS_SEGMENT = float(os.getenv("DEMUCS_SEGMENT", "7.8"))
+DEMUCS_OVERLAP = float(os.getenv("DEMUCS_OVERLAP", "0.1"))
+# Intra-op CPU threads for inference; defaults to the physical core count (half the logical CPUs)
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+# SQLite file mapping audio content hashes to vocals URLs (empty string disables the cache)
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "vocals_cache.sqlite3")
+# Decoded PCM cache on tmpfs, shared by all workers on the host (empty string disables it)
+PCM_CACHE_DIR = os.getenv("PCM_CACHE_DIR", "/dev/shm/vocal_pcm" if os.path.isdir("/dev/shm") else "")
+# tmpfs pages are charged to the service's memory cgroup (MemoryMax / the container limit),
+# so this budget comes out of the same memory as the model and request buffers
+PCM_CACHE_MAX_MB = int(os.getenv("PCM_CACHE_MAX_MB", "512"))
+# Parent of the per-worker scratch directory. Downloads have no size limit, so by default
+# they stay off /dev/shm, where they would compete with the PCM cache for its space
+WORK_TMP_ROOT = os.getenv("WORK_TMP_ROOT", tempfile.gettempdir())
 
 # Validate environment variables
 if not API_TOKEN:
     # Generate a token if not provided
     API_TOKEN = secrets.token_urlsafe(32)
-    print(f"⚠️  No API_TOKEN found in environment. Generated token: {API_TOKEN}")
-    print("   Set this token as API_TOKEN environment variable in production!")
+    logger.warning("No API_TOKEN found in environment. Generated token: %s", API_TOKEN)
+    logger.warning("Set this token as API_TOKEN environment variable in production!")
 
 if not VERCEL_BLOB_READ_WRITE_TOKEN:
     raise ValueError("VERCEL_BLOB_READ_WRITE_TOKEN environment variable is required!")
@@ -53,10 +111,65 @@ app = FastAPI(
 # Security
 security = HTTPBearer()
 
-# Load model once at startup
-print("Loading Demucs model...")
-MODEL = get_model('htdemucs')
-print("Model loaded successfully!")
+# Shared HTTP client (created on startup) so downloads and uploads reuse
+# pooled keep-alive HTTP/2 connections instead of a TLS handshake per call
+ASYNC_CLIENT: Optional[httpx.AsyncClient] = None
+# Scratch directory for this worker's lifetime (created on startup), one subdirectory per request
+WORKER_TMP: Optional[Path] = None
+STREAM_CHUNK_SIZE = 1 << 20
+
+# Audio I/O
+MP3_BITRATE_KBPS = 192
+
+# Results cache, keyed by the SHA-256 of the downloaded audio
+CACHE_DB = None
+if CACHE_DB_PATH:
+    CACHE_DB = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False)
+    with CACHE_DB:
+        CACHE_DB.execute(
+            "CREATE TABLE IF NOT EXISTS vocals ("
+            "content_hash TEXT PRIMARY KEY, vocals_url TEXT NOT NULL, created_at TEXT NOT NULL)"
+        )
+
+if PCM_CACHE_DIR:
+    os.makedirs(PCM_CACHE_DIR, exist_ok=True)
+
+# Thread pools must be sized before any parallel work runs, so this precedes model loading
+torch.set_num_threads(TORCH_THREADS)
+torch.set_num_interop_threads(1)
+torch.backends.mkldnn.enabled = True
+
+# Load model once at startup (GPU when available, CPU fallback)
+DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
+logger.info("Loading Demucs model on %s...", DEVICE)
+if MODEL_WEIGHTS.endswith(".safetensors"):
+    logger.info("Loading FP16 weights from %s...", MODEL_WEIGHTS)
+    MODEL = load_fp16_model(MODEL_WEIGHTS, DEVICE)
+else:
+    MODEL = get_model('htdemucs')
+    if MODEL_WEIGHTS:
+        logger.info("Loading INT8 weights from %s...", MODEL_WEIGHTS)
+        MODEL = load_quantized_weights(MODEL, MODEL_WEIGHTS)
+MODEL = MODEL.to(DEVICE).eval()
+MODEL = apply_precision(MODEL, MODEL_PRECISION, DEVICE)
+if TORCH_COMPILE:
+    compile_options = {"mode": TORCH_COMPILE_MODE}
+    if TORCH_COMPILE_BACKEND == "tensorrt":
+        try:
+            import torch_tensorrt  # noqa: F401 (registers the torch_tensorrt backend)
+            compile_options = {"backend": "torch_tensorrt", "options": {"enabled_precisions": {torch.float16}}}
+        except ImportError:
+            logger.warning("torch-tensorrt not installed, compiling with inductor instead")
+    # Compile the sub-models in place so apply_model still sees the Demucs classes
+    for sub_model in getattr(MODEL, 'models', [MODEL]):
+        sub_model.compile(fullgraph=False, dynamic=False, **compile_options)
+VOCALS_INDEX = MODEL.sources.index('vocals')
+
+# Model calls get their own single worker: there is one model instance on one device, so
+# concurrent calls would only contend for it, and decode/encode work in the default pool
+# never queues behind a separation
+MODEL_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="demucs")
+logger.info("Model loaded successfully (precision: %s, compiled: %s)", MODEL_PRECISION, TORCH_COMPILE)
 
 # Request/Response models
 class ExtractVocalsRequest(BaseModel):
@@ -68,37 +181,42 @@ class ExtractVocalsResponse(BaseModel):
 
 # Authentication dependency
 async def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)):
-    if credentials.credentials != API_TOKEN:
+    if not secrets.compare_digest(credentials.credentials.encode(), API_TOKEN.encode()):
         raise HTTPException(status_code=401, detail="Invalid authentication token")
     return credentials.credentials
 
 # Helper functions
 async def download_file(url: str, destination: Path):
-    """Download file from URL to destination"""
+    """Stream file from URL to destination"""
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36"
     }
-    async with httpx.AsyncClient() as client:
-        try:
-            print(f"Downloading file from: {url}")
-            response = await client.get(url, headers=headers, follow_redirects=True, timeout=30.0)
+    try:
+        logger.info("Downloading file from: %s", url)
+        async with ASYNC_CLIENT.stream("GET", url, headers=headers, follow_redirects=True, timeout=30.0) as response:
             response.raise_for_status()
-            
             async with aiofiles.open(destination, 'wb') as f:
-                await f.write(response.content)
-            print("File download complete.")
-        except httpx.RequestError as e:
-            print(f"HTTP Request error for {e.request.url}: {e}")
-            raise HTTPException(status_code=400, detail=f"Error downloading file: Network error accessing URL.")
-        except httpx.HTTPStatusError as e:
-            print(f"HTTP Status error for {e.request.url}: {e.response.status_code}")
-            raise HTTPException(status_code=400, detail=f"Error downloading file: Server returned status {e.response.status_code}.")
+                async for chunk in response.aiter_bytes(chunk_size=STREAM_CHUNK_SIZE):
+                    await f.write(chunk)
+        logger.info("File download complete.")
+    except httpx.RequestError as e:
+        logger.warning("HTTP Request error for %s: %s", e.request.url, e)
+        raise HTTPException(status_code=400, detail=f"Error downloading file: Network error accessing URL.")
+    except httpx.HTTPStatusError as e:
+        logger.warning("HTTP Status error for %s: %s", e.request.url, e.response.status_code)
+        raise HTTPException(status_code=400, detail=f"Error downloading file: Server returned status {e.response.status_code}.")
 
-async def upload_to_vercel_blob(file_path: Path, filename: str) -> str:
-    """Upload file to Vercel Blob Storage"""
+async def iter_file(file_path: Path):
+    """Yield a file's content in chunks so request bodies are streamed"""
     async with aiofiles.open(file_path, 'rb') as f:
-        file_content = await f.read()
+        while True:
+            chunk = await f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
 
+async def upload_to_vercel_blob(file_path: Path, filename: str) -> str:
+    """Upload file to Vercel Blob Storage"""
     # The final public path we want for our file
     blob_path = f"vocals/{filename}"
 
@@ -108,82 +226,260 @@ async def upload_to_vercel_blob(file_path: Path, filename: str) -> str:
     headers = {
         "Authorization": f"Bearer {VERCEL_BLOB_READ_WRITE_TOKEN}",
         "x-api-version": "6",
+        "content-length": str(file_path.stat().st_size),
     }
     if VERCEL_BLOB_STORE_ID:
         headers["x-vercel-blob-store-id"] = VERCEL_BLOB_STORE_ID
 
-    async with httpx.AsyncClient() as client:
-        response = await client.put(upload_url, content=file_content, headers=headers, timeout=60.0)
-        response.raise_for_status()
-        data = response.json()
-        print(f"Vercel Blob response: {data}")
-        
-        # The response URL should now be the correct, final URL.
-        final_url = data.get("url")
-        if not final_url or "vocals" not in final_url:
-             raise ValueError(f"Vercel response did not contain a valid vocals URL: {data}")
-        
-        return final_url
-
-def extract_vocals_sync(input_path: Path, output_path: Path):
-    """Synchronous vocal extraction using Demucs"""
-    print("SYNC: --- Vocal extraction process started ---")
+    response = await ASYNC_CLIENT.put(upload_url, content=iter_file(file_path), headers=headers, timeout=60.0)
+    response.raise_for_status()
+    data = response.json()
+    logger.info("Vercel Blob response: %s", data)
+
+    # The response URL should now be the correct, final URL.
+    final_url = data.get("url")
+    if not final_url or "vocals" not in final_url:
+        raise ValueError(f"Vercel response did not contain a valid vocals URL: {data}")
+
+    return final_url
+
+@contextmanager
+def request_temp_dir():
+    """Create a per-request scratch directory inside the worker's directory and remove it afterwards"""
+    path = WORKER_TMP / secrets.token_hex(8)
+    path.mkdir()
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def hash_file(file_path: Path) -> str:
+    """SHA-256 of a file's content (OpenSSL uses the CPU's SHA extensions when present)"""
+    with open(file_path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+# Settings that change the separated vocals; results made with other settings are not reused
+CACHE_KEY_SUFFIX = f"{MODEL_PRECISION}:{MODEL_WEIGHTS}:{DEMUCS_SEGMENT}:{DEMUCS_OVERLAP}"
+
+def cache_lookup(content_hash: str) -> Optional[str]:
+    """Return the vocals URL previously produced for this audio with the current settings, if any"""
+    if CACHE_DB is None:
+        return None
+    try:
+        row = CACHE_DB.execute(
+            "SELECT vocals_url FROM vocals WHERE content_hash = ?", (f"{content_hash}:{CACHE_KEY_SUFFIX}",)
+        ).fetchone()
+    except sqlite3.Error as e:
+        logger.warning("Result cache lookup failed: %s", e)
+        return None
+    return row[0] if row else None
+
+def cache_store(content_hash: str, vocals_url: str):
+    """Remember the vocals URL produced for this audio; failures only cost a future cache miss"""
+    if CACHE_DB is None:
+        return
     try:
-        # Load audio
-        print(f"SYNC: Loading audio from {input_path} with librosa...")
-        audio_data, sample_rate = librosa.load(str(input_path), sr=None, mono=False)
-        print(f"SYNC: Audio loaded successfully. Sample rate: {sample_rate}, Shape: {audio_data.shape}")
-
-        # Convert to torch tensor
-        print("SYNC: Converting to torch tensor...")
-        if audio_data.ndim == 1:
-            waveform = torch.from_numpy(audio_data).unsqueeze(0).repeat(2, 1)
-        else:
-            waveform = torch.from_numpy(audio_data)
-        print(f"SYNC: Tensor created. Shape: {waveform.shape}")
-
-        # Ensure stereo format
-        if waveform.shape[0] == 1:
-            waveform = waveform.repeat(2, 1)
-            print(f"SYNC: Mono converted to stereo. New shape: {waveform.shape}")
-        elif waveform.shape[0] > 2:
-            waveform = waveform[:2]
-            print(f"SYNC: Multi-channel reduced to stereo. New shape: {waveform.shape}")
-        
-        # Apply the model
-        print("SYNC: Applying Demucs model...")
-        with torch.no_grad():
-            sources = apply_model(MODEL, waveform[None], device='cpu')[0]
-        print("SYNC: Model applied successfully.")
-
-        # Extract vocals
-        vocals = sources[3]
-        print("SYNC: Vocals tensor extracted from sources.")
-
-        # Save temporary WAV
-        temp_wav = output_path.with_suffix('.wav')
-        print(f"SYNC: Saving temporary WAV to {temp_wav}")
-        sf.write(str(temp_wav), vocals.T.cpu().numpy(), sample_rate)
-        print("SYNC: Temporary WAV saved successfully.")
-
-        # Convert to MP3
-        print("SYNC: Loading WAV with pydub...")
-        audio = AudioSegment.from_wav(str(temp_wav))
-        print("SYNC: WAV loaded into pydub.")
-        print(f"SYNC: Exporting to MP3 at {output_path}...")
-        audio.export(str(output_path), format="mp3", bitrate="192k")
-        print("SYNC: MP3 exported successfully.")
-
-        # Clean up
-        print("SYNC: Cleaning up temporary WAV file...")
-        temp_wav.unlink()
-        print("SYNC: --- Vocal extraction process complete ---")
-
-    except Exception as e:
-        print(f"!!! SYNC: An unexpected error occurred in sync process: {e}")
-        import traceback
-        traceback.print_exc()
-        raise
+        with CACHE_DB:
+            CACHE_DB.execute(
+                "INSERT OR REPLACE INTO vocals (content_hash, vocals_url, created_at) VALUES (?, ?, ?)",
+                (f"{content_hash}:{CACHE_KEY_SUFFIX}", vocals_url, datetime.now().isoformat())
+            )
+    except sqlite3.Error as e:
+        logger.warning("Result cache store failed: %s", e)
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def float_to_int16(audio):
+        """Clamp, scale and interleave float [batch, channels, samples] audio into int16 [batch, samples, channels]"""
+        batch, channels, samples = audio.shape
+        out = np.empty((batch, samples, channels), np.int16)
+        for b in range(batch):
+            for t in prange(samples):
+                for c in range(channels):
+                    value = audio[b, c, t]
+                    if value > 1.0:
+                        value = 1.0
+                    elif value < -1.0:
+                        value = -1.0
+                    out[b, t, c] = np.int16(value * 32767.0)
+        return out
+
+    # Share the CPU budget with torch instead of starting one thread per logical CPU
+    numba.set_num_threads(min(TORCH_THREADS, numba.config.NUMBA_NUM_THREADS))
+    # Compile at import so the first request doesn't pay the JIT cost
+    float_to_int16(np.zeros((1, 2, 1), np.float32))
+else:
+    float_to_int16 = None
+
+def decode_audio(input_path: Path):
+    """Decode an audio file to a float32 array shaped [channels, samples]"""
+    try:
+        audio_data, sample_rate = sf.read(str(input_path), dtype='float32', always_2d=True)
+        return audio_data.T, sample_rate
+    except RuntimeError:
+        # libsndfile can't read this file (older builds lack MP3, no AAC at all)
+        pass
+
+    # Fall back to PyAV, decoding to planar float32
+    with av.open(str(input_path)) as container:
+        stream = container.streams.audio[0]
+        sample_rate = stream.codec_context.sample_rate
+        resampler = av.AudioResampler(format='fltp')
+        chunks = [
+            resampled.to_ndarray()
+            for frame in container.decode(stream)
+            for resampled in resampler.resample(frame)
+        ]
+    return np.concatenate(chunks, axis=1), sample_rate
+
+def encode_mp3(pcm: np.ndarray, sample_rate: int, output_path: Path):
+    """Stream interleaved int16 PCM shaped [samples, channels] into an MP3 file, one second at a time"""
+    encoder = lameenc.Encoder()
+    encoder.set_bit_rate(MP3_BITRATE_KBPS)
+    encoder.set_in_sample_rate(sample_rate)
+    encoder.set_channels(pcm.shape[1])
+    encoder.set_quality(2)
+    with open(output_path, 'wb') as f:
+        for start in range(0, pcm.shape[0], sample_rate):
+            f.write(encoder.encode(pcm[start:start + sample_rate].tobytes()))
+        f.write(encoder.flush())
+
+def run_model(mix: torch.Tensor) -> torch.Tensor:
+    """Separate a [batch, channels, samples] mix into [batch, sources, channels, samples]"""
+    # FP16 autocast only pays off on CUDA tensor cores; CPU stays in FP32
+    with torch.inference_mode(), torch.autocast(device_type=DEVICE, dtype=torch.float16, enabled=DEVICE == 'cuda'):
+        return apply_model(
+            MODEL, mix, segment=DEMUCS_SEGMENT, overlap=DEMUCS_OVERLAP, num_workers=0, device=DEVICE
+        )
+
+def warmup_model():
+    """
+    Run a dummy 10 second separation so CUDA init, kernel selection and compilation happen before the first request
+
+    The compiled model is specialized to its input shape, and the batcher calls it with
+    anywhere from 1 to MAX_BATCH tracks, so every batch size is warmed up.
+    """
+    logger.info("Warming up Demucs model...")
+    for batch_size in range(1, MAX_BATCH + 1):
+        run_model(torch.zeros(batch_size, 2, MODEL.samplerate * 10, device=DEVICE))
+    logger.info("Model warm-up complete.")
+
+def load_cached_pcm(content_hash: str):
+    """Memory-map previously decoded PCM for this audio, if cached"""
+    if not PCM_CACHE_DIR:
+        return None
+    for path in Path(PCM_CACHE_DIR).glob(f"pcm_{content_hash}_*.npy"):
+        try:
+            os.utime(path)  # Mark as recently used for eviction
+            # Copy-on-write mapping: zero-copy reads, and torch gets a writable array
+            audio_data = np.load(path, mmap_mode='c')
+        except (FileNotFoundError, ValueError):
+            continue  # Evicted or still being written by another worker
+        return audio_data, int(path.stem.rsplit('_', 1)[1])
+    return None
+
+def store_cached_pcm(content_hash: str, audio_data: np.ndarray, sample_rate: int):
+    """Save decoded PCM to the cache, then evict least recently used entries over the size limit"""
+    if not PCM_CACHE_DIR:
+        return
+    if audio_data.nbytes > PCM_CACHE_MAX_MB * 1024 * 1024:
+        return  # Would be evicted right away, after costing its size in tmpfs memory
+    cache_dir = Path(PCM_CACHE_DIR)
+    path = cache_dir / f"pcm_{content_hash}_{sample_rate}.npy"
+    temp_path = None
+    try:
+        # A unique temp file per call: concurrent requests for the same audio (e.g. retries)
+        # each write their own copy, and os.replace only ever publishes a complete file
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix=f".{path.name}.", suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, audio_data)
+        os.replace(temp_path, path)
+    except OSError as e:
+        # A full tmpfs must not fail the request; the cache is only an optimization
+        logger.warning("Could not cache decoded PCM: %s", e)
+        if temp_path is not None:
+            Path(temp_path).unlink(missing_ok=True)
+        return
+
+    entries = []
+    for entry in cache_dir.glob("pcm_*.npy"):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries, key=lambda e: e[0]):
+        if total_bytes <= PCM_CACHE_MAX_MB * 1024 * 1024:
+            break
+        entry.unlink(missing_ok=True)
+        total_bytes -= size
+
+def load_waveform(input_path: Path, content_hash: str):
+    """Decode an audio file (or reuse its cached PCM) into a stereo [2, samples] tensor"""
+    cached = load_cached_pcm(content_hash)
+    if cached is not None:
+        audio_data, sample_rate = cached
+        logger.info("SYNC: Reusing cached PCM for content %s", content_hash[:16])
+    else:
+        logger.info("SYNC: Decoding audio from %s...", input_path)
+        audio_data, sample_rate = decode_audio(input_path)
+        # With the result cache on, a PCM hit needs a result cache miss for the same audio,
+        # which is rare enough that the tmpfs write on every request doesn't pay off
+        if CACHE_DB is None:
+            store_cached_pcm(content_hash, audio_data, sample_rate)
+    logger.info("SYNC: Audio loaded successfully. Sample rate: %s, Shape: %s", sample_rate, audio_data.shape)
+
+    if audio_data.ndim == 1:
+        waveform = torch.from_numpy(audio_data).unsqueeze(0).expand(2, -1)
+    else:
+        waveform = torch.from_numpy(audio_data)
+
+    # Ensure stereo format; expand is a zero-copy view, the batch padding copies it once
+    if waveform.shape[0] == 1:
+        waveform = waveform.expand(2, -1)
+        logger.info("SYNC: Mono converted to stereo. New shape: %s", waveform.shape)
+    elif waveform.shape[0] > 2:
+        waveform = waveform[:2]
+        logger.info("SYNC: Multi-channel reduced to stereo. New shape: %s", waveform.shape)
+    return waveform, sample_rate
+
+def separate_vocals(waveforms: List[torch.Tensor]) -> List[np.ndarray]:
+    """Run one batched model call over several [2, samples] waveforms and return their int16 vocals"""
+    lengths = [waveform.shape[-1] for waveform in waveforms]
+
+    # Right-pad every waveform to the longest one; the padded tail is sliced off below
+    mix = torch.zeros(len(waveforms), 2, max(lengths))
+    for i, waveform in enumerate(waveforms):
+        mix[i, :, :lengths[i]] = waveform
+    mix = mix.to(DEVICE, non_blocking=True)
+
+    logger.info("SYNC: Applying Demucs model to a batch of %d...", len(waveforms))
+    vocals = run_model(mix)[:, VOCALS_INDEX]
+    logger.info("SYNC: Model applied successfully.")
+
+    if DEVICE == 'cpu' and float_to_int16 is not None:
+        # On CPU, one fused parallel pass does the clamp, scale, cast and interleave.
+        # The vocals slice is strided; a contiguous copy matches the layout compiled at
+        # import (numba would otherwise JIT a second specialization on the first request)
+        # and lets the inner loop read each channel sequentially
+        vocals = float_to_int16(np.ascontiguousarray(vocals.numpy()))
+        return [vocals[i, :length] for i, length in enumerate(lengths)]
+
+    # Convert to interleaved int16 on the model's device, so only 2 bytes/sample cross to the host.
+    # The vocals slice is a view into the model output (which we own), so clamp/scale it in place
+    # and only materialize the [batch, samples, channels] layout once, at 2 bytes per sample
+    # (in-place updates of inference tensors are only allowed under inference_mode)
+    with torch.inference_mode():
+        vocals = vocals.clamp_(-1, 1).mul_(32767).to(torch.int16).transpose(1, 2).contiguous().cpu()
+    return [vocals[i, :length].numpy() for i, length in enumerate(lengths)]
+
+BATCHER = VocalBatcher(separate_vocals, MODEL_EXECUTOR, MAX_BATCH, BATCH_WINDOW_MS / 1000)
 
 # API Endpoints
 @app.get("/health")
@@ -191,6 +487,13 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "model_loaded": MODEL is not None}
 
+@app.post("/warmup")
+async def warmup(token: str = Depends(verify_token)):
+    """Run a dummy separation so the model is warm before traffic is routed here"""
+    start = time.perf_counter()
+    await asyncio.get_event_loop().run_in_executor(MODEL_EXECUTOR, warmup_model)
+    return {"status": "warm", "seconds": round(time.perf_counter() - start, 3)}
+
 @app.post("/extract-vocals", response_model=ExtractVocalsResponse)
 async def extract_vocals(
     request: ExtractVocalsRequest,
@@ -207,12 +510,10 @@ async def extract_vocals(
     start_time = datetime.now()
     
     # Create temporary directory
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_path = Path(temp_dir)
-        
+    with request_temp_dir() as temp_path:
         try:
             # Generate unique filename based on URL hash
-            url_hash = hashlib.md5(str(request.mp3_url).encode()).hexdigest()[:8]
+            url_hash = hashlib.sha256(str(request.mp3_url).encode()).hexdigest()[:16]
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             
             # Download input file
@@ -221,21 +522,28 @@ async def extract_vocals(
 
             # Add logging for file size
             file_size = os.path.getsize(input_file)
-            print(f"Downloaded file size: {file_size} bytes")
+            logger.info("Downloaded file size: %d bytes", file_size)
             if file_size < 1024: # Check if file is reasonably sized
                 raise HTTPException(status_code=400, detail=f"Downloaded file is too small or empty ({file_size} bytes).")
+
+            # Skip the whole pipeline if this exact audio was processed before
+            loop = asyncio.get_event_loop()
+            content_hash = await loop.run_in_executor(None, hash_file, input_file)
+            cached_url = cache_lookup(content_hash)
+            if cached_url:
+                logger.info("Cache hit for content %s: %s", content_hash[:16], cached_url)
+                return ExtractVocalsResponse(
+                    vocals_url=cached_url,
+                    processing_time_seconds=(datetime.now() - start_time).total_seconds()
+                )
             
             # Process vocals
             output_file = temp_path / f"vocals_{url_hash}_{timestamp}.mp3"
             
-            # Run sync operation in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None, 
-                extract_vocals_sync,
-                input_file,
-                output_file
-            )
+            # Decode and encode in the thread pool; separation goes through the batcher
+            waveform, sample_rate = await loop.run_in_executor(None, load_waveform, input_file, content_hash)
+            vocals = await BATCHER.submit(waveform)
+            await loop.run_in_executor(None, encode_mp3, vocals, sample_rate, output_file)
             
             try:
                 # Upload to Vercel Blob
@@ -247,6 +555,7 @@ async def extract_vocals(
                 raise HTTPException(status_code=502, detail=f"Failed to upload to blob storage. Server returned: {e.response.status_code}")
             except ValueError as e:
                 raise HTTPException(status_code=500, detail=f"Failed to parse blob storage response: {e}")
+            cache_store(content_hash, vocals_url)
 
             # Calculate processing time
             processing_time = (datetime.now() - start_time).total_seconds()
@@ -260,9 +569,7 @@ async def extract_vocals(
             raise HTTPException(status_code=400, detail=f"Error downloading file: Server returned status {e.response.status_code}.")
         except Exception as e:
             # Add full traceback logging to see the exact error
-            import traceback
-            print("!!! An unexpected error occurred !!!")
-            traceback.print_exc()
+            logger.exception("An unexpected error occurred")
             raise HTTPException(
                 status_code=500,
                 detail=f"An unexpected processing error occurred: {str(e)}"
@@ -270,10 +577,30 @@ async def extract_vocals(
 
 @app.on_event("startup")
 async def startup_event():
-    """Log startup information"""
-    print(f"🚀 Vocal Extractor API starting on port 8000")
-    print(f"📋 API Token: {API_TOKEN[:8]}...{API_TOKEN[-8:]}")
-    print(f"☁️  Vercel Blob configured: {'✅' if VERCEL_BLOB_READ_WRITE_TOKEN else '❌'}")
+    """Create shared resources and log startup information"""
+    global ASYNC_CLIENT, WORKER_TMP
+    WORKER_TMP = Path(tempfile.mkdtemp(prefix="vocal_api_", dir=WORK_TMP_ROOT))
+    ASYNC_CLIENT = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        timeout=60.0
+    )
+
+    await asyncio.get_event_loop().run_in_executor(MODEL_EXECUTOR, warmup_model)
+    BATCHER.start()
+
+    logger.info("Vocal Extractor API starting on port 8000")
+    logger.info("API token: %s...%s", API_TOKEN[:8], API_TOKEN[-8:])
+    logger.info("Vercel Blob configured: %s", "yes" if VERCEL_BLOB_READ_WRITE_TOKEN else "no")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared resources"""
+    await BATCHER.stop()
+    await ASYNC_CLIENT.aclose()
+    MODEL_EXECUTOR.shutdown(wait=False)
+    shutil.rmtree(WORKER_TMP, ignore_errors=True)
+    LOG_LISTENER.stop()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
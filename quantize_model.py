@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Model Quantization for the Vocal Extractor
+Per-channel INT8 post-training quantization of the htdemucs weights,
+FP16 safetensors export for fast loading, and the serve-time precision
+switch used by the API.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import sys
+
+try:
+    import torch
+    from torch import nn
+    from demucs.apply import BagOfModels
+    from demucs.pretrained import get_model
+    from safetensors import safe_open
+    from safetensors.torch import save_file, load_file
+except ImportError:
+    print("Error: Required libraries not installed. Please run: pip install -r requirements.txt")
+    sys.exit(1)
+
+# Modules whose weights are stored as INT8 + per-channel scale
+QUANTIZED_MODULES = (nn.Conv1d, nn.Linear)
+
+SUPPORTED_PRECISIONS = ("fp32", "int8", "fp8")
+
+logger = logging.getLogger(__name__)
+
+def quantize_state_dict(model):
+    """
+    Quantize Conv1d/Linear weights to per-output-channel INT8
+
+    Each quantized `<module>.weight` is replaced by an int8 tensor and gets a
+    companion `<module>.weight_scale` tensor so that weight ~= w_q * scale.
+
+    Args:
+        model (nn.Module): The FP32 model to quantize
+
+    Returns:
+        dict: The quantized state dict
+    """
+    state = model.state_dict()
+    for name, module in model.named_modules():
+        if not isinstance(module, QUANTIZED_MODULES):
+            continue
+        weight = module.weight.detach().float()
+        flat = weight.reshape(weight.shape[0], -1)
+        scale = flat.abs().amax(dim=1, keepdim=True).clamp_min(1e-12) / 127
+        weight_q = torch.round(flat / scale).clamp(-127, 127).to(torch.int8)
+        state[f"{name}.weight"] = weight_q.reshape(weight.shape)
+        state[f"{name}.weight_scale"] = scale.reshape(-1)
+    return state
+
+def dequantize_state_dict(state):
+    """
+    Fold INT8 weights back into floating-point weights
+
+    Args:
+        state (dict): A state dict produced by quantize_state_dict
+
+    Returns:
+        dict: A regular floating-point state dict (without the scale tensors)
+    """
+    result = {}
+    for name, tensor in state.items():
+        if name.endswith(".weight_scale"):
+            continue
+        scale = state.get(f"{name}_scale")
+        if scale is not None:
+            shape = (-1,) + (1,) * (tensor.dim() - 1)
+            tensor = tensor.float() * scale.reshape(shape)
+        result[name] = tensor
+    return result
+
+def load_quantized_weights(model, path):
+    """
+    Load an INT8 checkpoint into a model, dequantizing every weight once
+
+    The dequantized weights stay in the model, so inference never repeats
+    the `w_q * scale` multiplication.
+
+    Args:
+        model (nn.Module): A model with the same architecture (e.g. from get_model)
+        path (str): Path to a checkpoint saved by this script
+
+    Returns:
+        nn.Module: The model with the checkpoint's weights loaded
+    """
+    state = torch.load(path, map_location="cpu", weights_only=True)
+    model.load_state_dict(dequantize_state_dict(state))
+    return model
+
+def export_fp16_weights(model, path):
+    """
+    Save a model's weights as FP16 safetensors, with what's needed to rebuild it
+
+    Demucs models record their constructor arguments (`_init_args_kwargs`), so
+    the class and arguments of every sub-model go into the file metadata and
+    load_fp16_model can rebuild the model without get_model or the hub cache.
+
+    Args:
+        model (nn.Module): A Demucs model or bag of models
+        path (str): Output .safetensors path
+    """
+    sub_models = getattr(model, 'models', [model])
+    tensors = {}
+    for index, sub_model in enumerate(sub_models):
+        for name, tensor in sub_model.state_dict().items():
+            tensor = tensor.half() if tensor.is_floating_point() else tensor
+            tensors[f"{index}.{name}"] = tensor.contiguous()
+    metadata = {
+        "models": json.dumps([
+            {
+                "class": f"{type(sub_model).__module__}.{type(sub_model).__qualname__}",
+                "args": sub_model._init_args_kwargs[0],
+                "kwargs": sub_model._init_args_kwargs[1],
+            }
+            for sub_model in sub_models
+        ], default=float),  # Fraction segment lengths become floats
+        "weights": json.dumps(getattr(model, 'weights', None)),
+    }
+    save_file(tensors, path, metadata=metadata)
+
+def load_fp16_model(path, device):
+    """
+    Rebuild a model saved by export_fp16_weights
+
+    The tensors are memory-mapped and loaded straight onto the device at half
+    the size of the FP32 checkpoint, then upcast into the model's FP32
+    parameters (autocast still picks FP16 kernels on CUDA).
+
+    Args:
+        path (str): Path to a .safetensors file saved by this script
+        device (str): The device to load the weights onto
+
+    Returns:
+        BagOfModels: The rebuilt model, on the device
+    """
+    with safe_open(path, framework="pt") as f:
+        metadata = f.metadata()
+    state = load_file(path, device=device)
+
+    sub_models = []
+    for index, spec in enumerate(json.loads(metadata["models"])):
+        module_name, class_name = spec["class"].rsplit(".", 1)
+        klass = getattr(importlib.import_module(module_name), class_name)
+        sub_model = klass(*spec["args"], **spec["kwargs"]).to(device)
+        prefix = f"{index}."
+        sub_model.load_state_dict({
+            name[len(prefix):]: tensor for name, tensor in state.items() if name.startswith(prefix)
+        })
+        sub_models.append(sub_model)
+    return BagOfModels(sub_models, json.loads(metadata["weights"]))
+
+def apply_precision(model, precision, device):
+    """
+    Convert a loaded model to the requested serving precision
+
+    Args:
+        model (nn.Module): The loaded FP32 model
+        precision (str): One of "fp32", "int8" or "fp8"
+        device (str): The device the model runs on ("cuda" or "cpu")
+
+    Returns:
+        nn.Module: The model to serve (FP32 if the precision is unavailable)
+    """
+    if precision not in SUPPORTED_PRECISIONS:
+        raise ValueError(f"Unsupported MODEL_PRECISION '{precision}', expected one of {SUPPORTED_PRECISIONS}")
+
+    if precision == "fp32":
+        return model
+
+    if device == "cpu":
+        if precision == "fp8":
+            logger.warning("FP8 requires a CUDA GPU, serving FP32 model")
+            return model
+        # Dynamic INT8 kernels exist for Linear only; Conv1d stays in FP32
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    try:
+        from torchao.quantization import quantize_, int8_weight_only, float8_weight_only
+    except ImportError:
+        logger.warning("torchao not installed, serving FP32 model instead of %s", precision)
+        return model
+
+    quantize_(model, int8_weight_only() if precision == "int8" else float8_weight_only())
+    return model
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the htdemucs weights to per-channel INT8")
+    parser.add_argument("-o", "--output", help="Output checkpoint path (default: htdemucs_int8.pt, or htdemucs_fp16.safetensors with --fp16)")
+    parser.add_argument("--fp16", action="store_true", help="Export FP16 safetensors weights instead of an INT8 checkpoint")
+
+    args = parser.parse_args()
+
+    print("Loading Demucs model...")
+    model = get_model('htdemucs')
+
+    if args.fp16:
+        output = args.output or "htdemucs_fp16.safetensors"
+        export_fp16_weights(model, output)
+        print(f"✅ FP16 weights saved to: {output}")
+        return
+
+    print("Quantizing Conv1d/Linear weights...")
+    state = quantize_state_dict(model)
+    output = args.output or "htdemucs_int8.pt"
+    torch.save(state, output)
+
+    fp32_bytes = sum(t.numel() * t.element_size() for t in model.state_dict().values())
+    int8_bytes = sum(t.numel() * t.element_size() for t in state.values())
+    print(f"✅ Quantized checkpoint saved to: {output}")
+    print(f"   Weights: {fp32_bytes / 1e6:.1f} MB -> {int8_bytes / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
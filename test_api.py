@@ -3,61 +3,79 @@
 Test script for Vocal Extractor API
 """
 
+import logging
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from time import sleep
 
+logger = logging.getLogger("test_api")
+
 # Configuration
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 API_TOKEN = os.getenv("API_TOKEN")
 
+# Number of extractions to run at once in the throughput test (skipped when 1)
+CONCURRENCY = int(os.getenv("CONCURRENCY", "1"))
+
 # Test MP3 URL (royalty-free sample)
 TEST_MP3_URL = "https://www.soundhelix.com/examples/mp3/SoundHelix-Song-1.mp3"
 
+# Distinct songs for the throughput test, so concurrent requests are not cache hits
+# (numbering starts at 2: Song-1 is TEST_MP3_URL, already cached by test_vocal_extraction)
+TEST_MP3_URL_TEMPLATE = "https://www.soundhelix.com/examples/mp3/SoundHelix-Song-{}.mp3"
+
+# One session for every call, so requests reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
 def test_health():
     """Test health endpoint"""
-    print("🏥 Testing health endpoint...")
+    logger.info("🏥 Testing health endpoint...")
     try:
-        response = requests.get(f"{API_URL}/health")
+        response = SESSION.get(f"{API_URL}/health")
         response.raise_for_status()
         data = response.json()
-        print(f"✅ Health check passed: {data}")
+        logger.info("✅ Health check passed: %s", data)
         return True
     except Exception as e:
-        print(f"❌ Health check failed: {e}")
+        logger.error("❌ Health check failed: %s", e)
         return False
 
 def test_auth():
     """Test authentication"""
-    print("\n🔐 Testing authentication...")
+    logger.info("\n🔐 Testing authentication...")
     
     if not API_TOKEN:
-        print("❌ No API_TOKEN found. Set it with: export API_TOKEN='your_token'")
+        logger.error("❌ No API_TOKEN found. Set it with: export API_TOKEN='your_token'")
         return False
     
     # Test with invalid token
     headers = {"Authorization": "Bearer invalid_token"}
-    response = requests.post(
+    response = SESSION.post(
         f"{API_URL}/extract-vocals",
         json={"mp3_url": TEST_MP3_URL},
         headers=headers
     )
     
     if response.status_code == 401:
-        print("✅ Invalid token correctly rejected")
+        logger.info("✅ Invalid token correctly rejected")
         return True
     else:
-        print(f"❌ Auth test failed: expected 401, got {response.status_code}")
+        logger.error("❌ Auth test failed: expected 401, got %s", response.status_code)
         return False
 
-def test_vocal_extraction():
+def test_vocal_extraction(mp3_url=TEST_MP3_URL, timeout=60):
     """Test vocal extraction endpoint"""
-    print("\n🎵 Testing vocal extraction...")
+    logger.info("\n🎵 Testing vocal extraction...")
     
     if not API_TOKEN:
-        print("❌ No API_TOKEN found")
+        logger.error("❌ No API_TOKEN found")
         return False
     
     headers = {
@@ -65,42 +83,61 @@ def test_vocal_extraction():
         "Content-Type": "application/json"
     }
     
-    print(f"   Using test MP3: {TEST_MP3_URL}")
-    print("   This may take 10-30 seconds...")
+    logger.info("   Using test MP3: %s", mp3_url)
+    logger.info("   This may take 10-30 seconds...")
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{API_URL}/extract-vocals",
-            json={"mp3_url": TEST_MP3_URL},
+            json={"mp3_url": mp3_url},
             headers=headers,
-            timeout=60
+            timeout=timeout
         )
         response.raise_for_status()
         
         data = response.json()
-        print(f"✅ Vocal extraction successful!")
-        print(f"   Vocals URL: {data['vocals_url']}")
-        print(f"   Processing time: {data['processing_time_seconds']:.2f} seconds")
+        logger.info("✅ Vocal extraction successful!")
+        logger.info("   Vocals URL: %s", data['vocals_url'])
+        logger.info("   Processing time: %.2f seconds", data['processing_time_seconds'])
         return True
         
     except requests.exceptions.Timeout:
-        print("❌ Request timed out (>60s)")
+        logger.error("❌ Request timed out (>%ss)", timeout)
         return False
     except Exception as e:
-        print(f"❌ Vocal extraction failed: {e}")
+        logger.error("❌ Vocal extraction failed: %s", e)
         if hasattr(e, 'response') and e.response:
-            print(f"   Response: {e.response.text}")
+            logger.error("   Response: %s", e.response.text)
         return False
 
+def benchmark_concurrent_extraction(concurrency):
+    """Run concurrent extractions and report aggregate throughput"""
+    logger.info("\n🚀 Testing %d concurrent extractions...", concurrency)
+    
+    urls = [TEST_MP3_URL_TEMPLATE.format(i % 15 + 2) for i in range(concurrency)]
+    # Requests queue behind each other on the server, so allow for all of them
+    timeout = 60 * concurrency
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(test_vocal_extraction, url, timeout) for url in urls]
+        succeeded = sum(future.result() for future in as_completed(futures))
+    elapsed = time.perf_counter() - start
+    
+    logger.info("\n   %d/%d extractions succeeded in %.2f seconds", succeeded, concurrency, elapsed)
+    logger.info("   Throughput: %.3f requests/second", succeeded / elapsed)
+    return succeeded == concurrency
+
 def main():
-    print("🧪 Vocal Extractor API Test Suite")
-    print("=================================")
-    print(f"API URL: {API_URL}")
-    print(f"API Token: {'***' + API_TOKEN[-8:] if API_TOKEN else 'NOT SET'}")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logger.info("🧪 Vocal Extractor API Test Suite")
+    logger.info("=================================")
+    logger.info("API URL: %s", API_URL)
+    logger.info("API Token: %s", '***' + API_TOKEN[-8:] if API_TOKEN else 'NOT SET')
     
     # Run tests
     tests_passed = 0
-    total_tests = 3
+    total_tests = 4 if CONCURRENCY > 1 else 3
     
     if test_health():
         tests_passed += 1
@@ -111,16 +148,19 @@ def main():
     if test_vocal_extraction():
         tests_passed += 1
     
+    if CONCURRENCY > 1 and benchmark_concurrent_extraction(CONCURRENCY):
+        tests_passed += 1
+    
     # Summary
-    print("\n📊 Test Summary")
-    print("===============")
-    print(f"Passed: {tests_passed}/{total_tests}")
+    logger.info("\n📊 Test Summary")
+    logger.info("===============")
+    logger.info("Passed: %d/%d", tests_passed, total_tests)
     
     if tests_passed == total_tests:
-        print("✅ All tests passed! Your API is working correctly.")
+        logger.info("✅ All tests passed! Your API is working correctly.")
         return 0
     else:
-        print("❌ Some tests failed. Check the output above.")
+        logger.error("❌ Some tests failed. Check the output above.")
         return 1
 
 if __name__ == "__main__":
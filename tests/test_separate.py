@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the CLI's batched segment separation, with stub models
+
+Run from the repository root: python -m unittest discover tests
+"""
+
+import unittest
+
+try:
+    import torch
+    from torch import nn
+    from vocal_extractor import separate
+except (ImportError, SystemExit):  # vocal_extractor exits when its dependencies are missing
+    torch = None
+
+SOURCES = ["drums", "bass", "other", "vocals"]
+
+if torch is not None:
+    class StubModel(nn.Module):
+        """Returns its input, times `gain`, once per source; records every batch shape"""
+
+        def __init__(self, gain=1.0):
+            super().__init__()
+            self.sources = SOURCES
+            self.samplerate = 100
+            self.segment = 1.0  # 100 samples per segment, stride 75 with overlap=0.25
+            self.gain = gain
+            self.batch_shapes = []
+
+        def forward(self, batch):
+            self.batch_shapes.append(tuple(batch.shape))
+            return (batch * self.gain)[:, None].expand(-1, len(self.sources), -1, -1)
+
+    class StubBag(nn.Module):
+        """Stands in for demucs' BagOfModels"""
+
+        def __init__(self, models, weights):
+            super().__init__()
+            self.models = nn.ModuleList(models)
+            self.weights = weights
+            self.sources = SOURCES
+
+@unittest.skipIf(torch is None, "torch, torchaudio and demucs are required")
+class SeparateTest(unittest.TestCase):
+
+    def assert_reproduces_mix(self, length, batch_size=2, fixed_batch=False):
+        model = StubModel()
+        mix = torch.randn(2, length)
+
+        out = separate(model, mix, batch_size, fixed_batch=fixed_batch)
+
+        self.assertEqual(out.shape, (len(SOURCES), 2, length))
+        for source_out in out:
+            torch.testing.assert_close(source_out, mix, rtol=1e-5, atol=1e-5)
+        return model
+
+    def test_input_shorter_than_one_segment(self):
+        self.assert_reproduces_mix(50)
+
+    def test_length_multiple_of_stride(self):
+        self.assert_reproduces_mix(300)
+
+    def test_ragged_length(self):
+        self.assert_reproduces_mix(263)
+
+    def test_fixed_batch_drops_the_padding(self):
+        # 263 samples -> 4 segments, so the second batch of 3 holds 1 segment and 2 padding rows
+        model = self.assert_reproduces_mix(263, batch_size=3, fixed_batch=True)
+        self.assertEqual(model.batch_shapes, [(3, 2, 100), (3, 2, 100)])
+
+    def test_bag_weights_per_source(self):
+        weights = [[1.0, 1.0, 3.0, 0.5], [1.0, 3.0, 1.0, 1.5]]
+        bag = StubBag([StubModel(gain=1.0), StubModel(gain=2.0)], weights)
+        mix = torch.randn(2, 263)
+
+        out = separate(bag, mix, batch_size=2)
+
+        for index, source_out in enumerate(out):
+            first, second = weights[0][index], weights[1][index]
+            expected = mix * (first * 1.0 + second * 2.0) / (first + second)
+            torch.testing.assert_close(source_out, expected, rtol=1e-5, atol=1e-5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the request batcher, with a stub in place of the model
+
+Run from the repository root: python -m unittest discover tests
+"""
+
+import asyncio
+import unittest
+
+from vocal_batcher import VocalBatcher
+
+class StubSeparator:
+    """Records each batch it is called with and returns one result per waveform"""
+
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+
+    def __call__(self, waveforms):
+        self.batches.append(list(waveforms))
+        if self.error:
+            raise self.error
+        return [f"vocals:{waveform}" for waveform in waveforms]
+
+class VocalBatcherTest(unittest.IsolatedAsyncioTestCase):
+
+    async def start_batcher(self, separate, max_batch=4, window_seconds=0.05):
+        batcher = VocalBatcher(separate, None, max_batch, window_seconds)
+        batcher.start()
+        self.addAsyncCleanup(batcher.stop)
+        return batcher
+
+    async def test_coalesces_concurrent_requests(self):
+        separate = StubSeparator()
+        batcher = await self.start_batcher(separate)
+
+        results = await asyncio.gather(*(batcher.submit(name) for name in ["a", "b", "c"]))
+
+        self.assertEqual(separate.batches, [["a", "b", "c"]])
+        self.assertEqual(results, ["vocals:a", "vocals:b", "vocals:c"])
+
+    async def test_splits_batches_at_max_batch(self):
+        separate = StubSeparator()
+        batcher = await self.start_batcher(separate, max_batch=2)
+
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+        self.assertEqual([len(batch) for batch in separate.batches], [2, 2, 1])
+        self.assertEqual(results, [f"vocals:{i}" for i in range(5)])
+
+    async def test_requests_after_the_window_get_their_own_batch(self):
+        separate = StubSeparator()
+        batcher = await self.start_batcher(separate, window_seconds=0.01)
+
+        first = await batcher.submit("a")
+        second = await batcher.submit("b")
+
+        self.assertEqual(separate.batches, [["a"], ["b"]])
+        self.assertEqual((first, second), ("vocals:a", "vocals:b"))
+
+    async def test_error_fans_out_to_every_request_in_the_batch(self):
+        separate = StubSeparator(error=RuntimeError("CUDA out of memory"))
+        batcher = await self.start_batcher(separate)
+
+        results = await asyncio.gather(*(batcher.submit(name) for name in ["a", "b"]), return_exceptions=True)
+
+        self.assertEqual(len(separate.batches), 1)
+        for result in results:
+            self.assertIsInstance(result, RuntimeError)
+
+        # The batcher keeps serving after a failed batch
+        separate.error = None
+        self.assertEqual(await batcher.submit("c"), "vocals:c")
+
+if __name__ == "__main__":
+    unittest.main()
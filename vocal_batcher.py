@@ -0,0 +1,71 @@
+"""
+Request batching for the Vocal Extractor API
+Coalesces concurrent separation requests into batched model calls.
+"""
+
+import asyncio
+from concurrent.futures import Executor
+from typing import Callable, List, Optional
+
+class VocalBatcher:
+    """Coalesces concurrent separation requests into batched model calls"""
+
+    def __init__(self, separate: Callable[[List], List], executor: Optional[Executor], max_batch: int, window_seconds: float):
+        """
+        Args:
+            separate: Turns a list of waveforms into a list of vocals, in the same order
+            executor: Where `separate` runs (None for the event loop's default executor)
+            max_batch: Largest number of waveforms passed to one `separate` call
+            window_seconds: How long to wait for more requests after the first one
+        """
+        self.separate = separate
+        self.executor = executor
+        self.max_batch = max_batch
+        self.window_seconds = window_seconds
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    async def submit(self, waveform):
+        """Queue a waveform for separation and wait for its vocals"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((waveform, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for a first request, then collect more until the window closes or the batch is full
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window_seconds
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            waveforms = [waveform for waveform, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.separate, waveforms)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), vocals in zip(batch, results):
+                if not future.done():
+                    future.set_result(vocals)
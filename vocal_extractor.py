@@ -5,109 +5,265 @@ Extracts vocals from audio files using the Demucs library.
 """
 
 import argparse
+import io
+import logging
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+# Intra-op CPU threads; defaults to the physical core count (half the logical CPUs).
+# The OpenMP/MKL pools are sized when torch is imported, so they are set before it
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+os.environ.setdefault("OMP_NUM_THREADS", str(TORCH_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(TORCH_THREADS))
+
 try:
     import torch
+    import torch.nn.functional as F
     import torchaudio
-    import librosa
     import soundfile as sf
     from demucs.pretrained import get_model
-    from demucs.apply import apply_model
     from demucs.audio import save_audio
 except ImportError:
     print("Error: Required libraries not installed. Please run: pip install -r requirements.txt")
     sys.exit(1)
 
-def extract_vocals(input_file, output_dir="output"):
+from quantize_model import apply_precision, load_fp16_model
+
+logger = logging.getLogger("vocal_extractor")
+
+torch.set_num_threads(TORCH_THREADS)
+
+# Run on the GPU when one is available
+DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
+
+# Dynamic INT8 quantization for the CPU path; only a win on CPUs with VNNI, so opt-in
+QUANTIZE_CPU = os.getenv("QUANTIZE_CPU", "0") == "1"
+
+# Model is loaded once and reused for every file processed by this process
+_MODEL = None
+
+def _get_model(weights=None):
+    """Load htdemucs (or FP16 safetensors weights) onto DEVICE the first time it's needed and cache it"""
+    global _MODEL
+    if _MODEL is None:
+        logger.info("Loading Demucs model on %s...", DEVICE)
+        model = load_fp16_model(weights, DEVICE) if weights else get_model('htdemucs')
+        _MODEL = model.to(DEVICE).eval()
+        if DEVICE == 'cpu' and QUANTIZE_CPU:
+            logger.info("Quantizing model to INT8 for CPU inference...")
+            _MODEL = apply_precision(_MODEL, "int8", DEVICE)
+    return _MODEL
+
+# Rough GPU memory needed per segment in a batch, used to pick a default batch size
+SEGMENT_MEMORY_BYTES = 1 << 30
+
+def default_batch_size():
+    """Pick how many segments to run per model call from the free GPU memory"""
+    if DEVICE != 'cuda':
+        return 1
+    free_bytes, _ = torch.cuda.mem_get_info()
+    return max(1, min(16, free_bytes // SEGMENT_MEMORY_BYTES))
+
+def compile_model(model, batch_size, backend="inductor"):
+    """
+    Compile each sub-model with torch.compile and pay the compile cost up front
+
+    Every model call sees a fixed [batch_size, 2, segment_length] shape (see
+    separate's fixed_batch), so one warm-up call per sub-model is all it takes.
+
+    Args:
+        model (nn.Module): A Demucs model or bag of models, already on DEVICE
+        batch_size (int): Number of segments per model call
+        backend (str): "inductor", or "tensorrt" to build FP16 TensorRT engines
+            for the supported subgraphs (needs torch-tensorrt and a CUDA GPU)
+    """
+    compile_options = {"mode": 'reduce-overhead'}
+    if backend == "tensorrt":
+        try:
+            import torch_tensorrt  # noqa: F401 (registers the torch_tensorrt backend)
+            compile_options = {"backend": "torch_tensorrt", "options": {"enabled_precisions": {torch.float16}}}
+        except ImportError:
+            logger.warning("torch-tensorrt not installed, compiling with inductor instead")
+    logger.info("Compiling model (first run takes a while)...")
+    for sub_model in getattr(model, 'models', [model]):
+        sub_model.compile(fullgraph=False, dynamic=False, **compile_options)
+        segment_length = int(sub_model.samplerate * float(sub_model.segment))
+        dummy = torch.zeros(batch_size, 2, segment_length, device=DEVICE)
+        with torch.no_grad(), torch.autocast(device_type=DEVICE, dtype=torch.float16, enabled=DEVICE == 'cuda'):
+            sub_model(dummy)
+
+def separate(model, mix, batch_size, overlap=0.25, fixed_batch=False):
+    """
+    Separate a mix by running the model on batches of overlapping segments
+
+    Segments are stacked into [batch_size, channels, segment_length] tensors so
+    each model call keeps the GPU busy, then overlap-added with a triangular
+    window (the same weighting demucs' apply_model uses).
+
+    Args:
+        model (nn.Module): A Demucs model or bag of models
+        mix (torch.Tensor): The [channels, samples] mix, on the model's device
+        batch_size (int): Number of segments per model call
+        overlap (float): Fraction of each segment overlapping the next one
+        fixed_batch (bool): Zero-pad the last batch to batch_size so a compiled
+            model never sees a new input shape
+
+    Returns:
+        torch.Tensor: The [sources, channels, samples] separated stems
+    """
+    sub_models = getattr(model, 'models', [model])
+    bag_weights = getattr(model, 'weights', [[1.0] * len(model.sources)])
+    length = mix.shape[-1]
+    total = None
+
+    for sub_model, weights in zip(sub_models, bag_weights):
+        segment_length = int(sub_model.samplerate * float(sub_model.segment))
+        stride = int((1 - overlap) * segment_length)
+        offsets = list(range(0, length, stride))
+        padded = F.pad(mix, (0, offsets[-1] + segment_length - length))
+        window = torch.cat([
+            torch.arange(1, segment_length // 2 + 1),
+            torch.arange(segment_length - segment_length // 2, 0, -1)
+        ]).to(mix.device, torch.float32)
+
+        # Accumulate each batch into fixed buffers as soon as it is computed, so
+        # memory stays at one batch of outputs whatever the track length
+        out = torch.zeros(len(sub_model.sources), mix.shape[0], padded.shape[-1], device=mix.device)
+        weight = torch.zeros(padded.shape[-1], device=mix.device)
+        for start in range(0, len(offsets), batch_size):
+            batch_offsets = offsets[start:start + batch_size]
+            batch = torch.stack([padded[:, offset:offset + segment_length] for offset in batch_offsets])
+            if fixed_batch and len(batch_offsets) < batch_size:
+                batch = F.pad(batch, (0, 0, 0, 0, 0, batch_size - len(batch_offsets)))
+            batch_out = sub_model(batch)
+            for offset, segment_out in zip(batch_offsets, batch_out):
+                out[..., offset:offset + segment_length].addcmul_(segment_out.float(), window)
+                weight[offset:offset + segment_length].add_(window)
+            del batch_out
+        out = out[..., :length].div_(weight[:length])
+
+        out *= torch.tensor(weights, device=mix.device)[:, None, None]
+        total = out if total is None else total + out
+
+    return total / torch.tensor(bag_weights, device=mix.device).sum(dim=0)[:, None, None]
+
+def extract_vocals(input_file, output_dir="output", batch_size=None, vocals_only=False, audio_format="wav", compiled=False):
     """
     Extract vocals from an audio file using Demucs
     
     Args:
-        input_file (str): Path to the input audio file
+        input_file (str | bytes | BinaryIO): Path to the input audio file, or its
+            encoded contents (bytes or a binary file object) to decode in memory
         output_dir (str): Directory to save the output files
+        batch_size (int): Segments per model call (default: based on free GPU memory)
+        vocals_only (bool): Skip computing and saving the accompaniment
+        audio_format (str): Output format, "wav", "flac" or "mp3"
+        compiled (bool): The model was compiled by compile_model for this batch size
     """
     
-    # Check if input file exists
-    if not os.path.exists(input_file):
-        print(f"Error: Input file '{input_file}' not found")
-        return False
+    # Encoded audio already in memory is decoded from a buffer, without a temp file
+    if isinstance(input_file, (bytes, bytearray)):
+        input_file = io.BytesIO(input_file)
+    if isinstance(input_file, (str, os.PathLike)):
+        # Check if input file exists
+        if not os.path.exists(input_file):
+            logger.error("Error: Input file '%s' not found", input_file)
+            return False
+        display_name = input_file
+    else:
+        display_name = getattr(input_file, 'name', None) or "stdin"
     
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
     try:
-        print(f"Processing: {input_file}")
+        logger.info("Processing: %s", display_name)
         
         # Load the pre-trained model (htdemucs is good for vocals)
-        print("Loading Demucs model...")
-        model = get_model('htdemucs')
+        model = _get_model()
         
-        # Load the audio file using librosa (more reliable for various formats)
-        print("Loading audio file...")
-        audio_data, sample_rate = librosa.load(input_file, sr=None, mono=False)
+        # Load the audio file straight into a float32 [channels, samples] tensor
+        logger.info("Loading audio file...")
+        waveform, sample_rate = torchaudio.load(input_file)
         
-        # Convert to torch tensor and ensure stereo format
-        if audio_data.ndim == 1:
-            # Mono to stereo
-            waveform = torch.from_numpy(audio_data).unsqueeze(0).repeat(2, 1)
-        else:
-            # Already stereo or multi-channel
-            waveform = torch.from_numpy(audio_data)
-            if waveform.shape[0] == 1:
-                waveform = waveform.repeat(2, 1)
-            elif waveform.shape[0] > 2:
-                waveform = waveform[:2]
+        # Ensure stereo format
+        if waveform.shape[0] == 1:
+            # Mono to stereo as a zero-copy view; segment stacking copies it once
+            waveform = waveform.expand(2, -1)
+        elif waveform.shape[0] > 2:
+            waveform = waveform[:2]
         
         # Apply the model
-        print("Separating audio tracks...")
-        with torch.no_grad():
-            sources = apply_model(model, waveform[None], device='cpu')[0]
+        logger.info("Separating audio tracks...")
+        # Half precision on CUDA runs the convs/attention on tensor cores; CPU stays in FP32
+        with torch.no_grad(), torch.autocast(device_type=DEVICE, dtype=torch.float16, enabled=DEVICE == 'cuda'):
+            sources = separate(model, waveform.to(DEVICE), batch_size or default_batch_size(), fixed_batch=compiled)
         
-        # The sources are: [drums, bass, other, vocals]
-        drums, bass, other, vocals = sources
+        # Keep only the vocals stem (only it is copied to the host) and release
+        # drums/bass/other before any file I/O to lower peak memory
+        vocals = sources[model.sources.index('vocals')].float().cpu()
+        del sources
+        if DEVICE == 'cuda':
+            torch.cuda.empty_cache()
         
         # Extract the base filename without extension
-        base_name = Path(input_file).stem
-        
-        # Save the vocals track
-        vocals_output = os.path.join(output_dir, f"{base_name}_vocals.wav")
-        save_audio(vocals, vocals_output, sample_rate)
+        base_name = Path(str(display_name)).stem
         
-        # Create accompaniment by summing non-vocal sources
-        accompaniment = drums + bass + other
-        accompaniment_output = os.path.join(output_dir, f"{base_name}_accompaniment.wav")
-        save_audio(accompaniment, accompaniment_output, sample_rate)
+        # Write the tracks concurrently; libsndfile/lame release the GIL while encoding
+        outputs = {"Vocals": (vocals, os.path.join(output_dir, f"{base_name}_vocals.{audio_format}"))}
+        if not vocals_only:
+            # The stems sum (approximately) to the mix, so one subtraction replaces
+            # summing the three other stems and keeps vocals + accompaniment == mix
+            accompaniment = waveform - vocals
+            outputs["Accompaniment"] = (accompaniment, os.path.join(output_dir, f"{base_name}_accompaniment.{audio_format}"))
+        with ThreadPoolExecutor(max_workers=len(outputs)) as executor:
+            saves = [executor.submit(save_audio, track, path, sample_rate) for track, path in outputs.values()]
+            for save in saves:
+                save.result()
         
-        print(f"✅ Vocals extracted successfully!")
-        print(f"   Vocals saved to: {vocals_output}")
-        print(f"   Accompaniment saved to: {accompaniment_output}")
+        logger.info("✅ Vocals extracted successfully!")
+        for name, (_, path) in outputs.items():
+            logger.info("   %s saved to: %s", name, path)
         
         return True
         
     except Exception as e:
-        print(f"Error processing audio: {str(e)}")
+        logger.error("Error processing audio: %s", e)
         return False
 
 def main():
     parser = argparse.ArgumentParser(description="Extract vocals from audio files using Demucs")
-    parser.add_argument("input_file", help="Input audio file path")
+    parser.add_argument("input_files", nargs="+", help="Input audio file path(s), or - to read from stdin")
     parser.add_argument("-o", "--output", default="output", help="Output directory (default: output)")
     parser.add_argument("--vocals-only", action="store_true", help="Save only vocals track")
+    parser.add_argument("--format", choices=["wav", "flac", "mp3"], default="wav", help="Output format (default: wav; flac is lossless and 2-3x smaller)")
+    parser.add_argument("--batch-size", type=int, help="Segments per model call (default: based on free GPU memory)")
+    parser.add_argument("--weights", help="FP16 .safetensors weights exported by quantize_model.py --fp16 (default: pretrained htdemucs)")
+    parser.add_argument("--compile", action="store_true", help="torch.compile the model first; pays off when processing several files")
+    parser.add_argument("--backend", choices=["inductor", "tensorrt"], default="inductor", help="Compiler backend for --compile (tensorrt needs torch-tensorrt and a CUDA GPU)")
     
     args = parser.parse_args()
     
-    print("🎵 Vocal Extractor using Demucs")
-    print("=" * 40)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logger.info("🎵 Vocal Extractor using Demucs")
+    logger.info("=" * 40)
+    
+    _get_model(args.weights)
+    
+    if args.compile:
+        args.batch_size = args.batch_size or default_batch_size()
+        compile_model(_get_model(), args.batch_size, args.backend)
     
-    success = extract_vocals(args.input_file, args.output)
+    # The model stays loaded between files, so several files in one run only pay for it once
+    inputs = [sys.stdin.buffer.read() if input_file == "-" else input_file for input_file in args.input_files]
+    success = all([extract_vocals(input_file, args.output, args.batch_size, args.vocals_only, args.format, args.compile) for input_file in inputs])
     
     if success:
-        print("\n🎉 Processing completed successfully!")
+        logger.info("\n🎉 Processing completed successfully!")
     else:
-        print("\n❌ Processing failed!")
+        logger.error("\n❌ Processing failed!")
         sys.exit(1)
 
 if __name__ == "__main__":